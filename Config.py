@@ -1,7 +1,53 @@
+import time
+
 USE_SEARCH_DEFAULT = True
 USE_URL_FETCH_DEFAULT = False
 AUTO_FETCH_TOP_RESULT_DEFAULT = True
 
+# Caps for the per-session collections that otherwise grow for the life
+# of a session (and get reserialized in full on every save).
+JOBS_MAX = 50
+JOB_FINISHED_TTL_S = 3600
+DBG_LIST_MAX = 500
+_DBG_LIST_KEYS = ("dbg_log", "dbg_errors", "dbg_timings", "dbg_fetches")
+
+
+def _bound_collections(state: dict):
+    """Trim unbounded per-session collections in place.
+
+    Lists are sliced rather than swapped for deques so the state stays
+    JSON-serializable for save_session.
+    """
+    jobs = state.get("jobs")
+    if jobs:
+        cutoff = time.time() - JOB_FINISHED_TTL_S
+        stale = [
+            rid
+            for rid, job in jobs.items()
+            if job.get("status") in ("done", "error")
+            and job.get("updated_at", 0) < cutoff
+        ]
+        for rid in stale:
+            del jobs[rid]
+            state.get("pending_requests", {}).pop(rid, None)
+        if len(jobs) > JOBS_MAX:
+            # Dicts preserve insertion order, so the head is the oldest.
+            # Running jobs are exempt: their finalizers still write into
+            # the table mid-stream.
+            excess = len(jobs) - JOBS_MAX
+            for rid in list(jobs):
+                if excess <= 0:
+                    break
+                if jobs[rid].get("status") == "running":
+                    continue
+                del jobs[rid]
+                state.get("pending_requests", {}).pop(rid, None)
+                excess -= 1
+    for key in _DBG_LIST_KEYS:
+        entries = state.get(key)
+        if entries and len(entries) > DBG_LIST_MAX:
+            del entries[: len(entries) - DBG_LIST_MAX]
+
 
 def apply_defaults(state: dict):
     """
@@ -15,3 +61,4 @@ def apply_defaults(state: dict):
     state.setdefault("file_context", "")
     state.setdefault("user_location", None)
     state.setdefault("search_history", [])
+    _bound_collections(state)
@@ -4,6 +4,7 @@ import time
 import os
 import json
 import atexit
+from contextvars import ContextVar
 from datetime import datetime
 from pathlib import Path
 from contextlib import contextmanager
@@ -11,7 +12,16 @@ from contextlib import contextmanager
 # Simple opt-in console logging; controlled via env for noisier runs.
 _debug_stdout_flag = "DEBUG_TO_STDOUT"
 
-_current_state: dict | None = None
+# Master switch for the dbg() breadcrumb trail. Read once at import so
+# hot paths can check a plain module attribute; errors, timings and
+# fetch records are kept regardless.
+DEBUG_ENABLED = os.environ.get("DEBUG_ENABLED", "1") != "0"
+
+# The attached session state rides a ContextVar rather than a plain
+# global: run_in_threadpool and asyncio.create_task both run their work
+# in a copy of the calling context, so concurrent requests each see the
+# state they attached instead of whichever session attached last.
+_current_state: ContextVar = ContextVar("debug_state", default=None)
 _debug_env_flag = "USE_DEBUG_SETTINGS"
 _debug_force_key = "DEBUG_FORCE_MODEL"
 
@@ -149,14 +159,14 @@ def _log_flag(flag: str):
 
 def attach_state(state: dict):
     """Point debug helpers at the active session state."""
-    global _current_state
-    _current_state = state
+    _current_state.set(state)
 
 
 def get_state() -> dict:
-    if _current_state is None:
+    state = _current_state.get()
+    if state is None:
         raise RuntimeError("Debug state is not attached")
-    return _current_state
+    return state
 
 
 def init_debug(state: dict):
@@ -171,7 +181,17 @@ def init_debug(state: dict):
     log_active_flags()
 
 
-def dbg(message: str):
+def dbg(message: str, *args):
+    """Record a debug breadcrumb.
+
+    Accepts printf-style args (like logging.Logger.debug) so callers can
+    pass ``dbg("got %d chunks", n)`` and the formatting only happens when
+    debugging is enabled.
+    """
+    if not DEBUG_ENABLED:
+        return
+    if args:
+        message = message % args
     state = _maybe_state()
     if state is not None:
         _ensure_debug_keys(state)
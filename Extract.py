@@ -0,0 +1,82 @@
+"""Text extraction for uploaded files.
+
+Kept as a leaf module (no app imports) so process-pool workers that
+import it don't pull in routes/Model, which probe the Ollama endpoint at
+import time.
+"""
+from pathlib import Path
+from typing import List
+
+
+# Maps printable bytes (tab/newline/CR and the ASCII range) to 1 and
+# everything else to 0, so the ratio check is a C-level translate + sum
+# instead of a Python loop over every byte.
+_PRINTABLE_TABLE = bytes(
+    1 if (b in (9, 10, 13) or 32 <= b <= 126) else 0 for b in range(256)
+)
+
+
+def is_probably_text(data: bytes) -> bool:
+    if not data:
+        return True
+    sample = data[:4096]
+    if b"\x00" in sample:
+        return False
+    printable = sum(sample.translate(_PRINTABLE_TABLE))
+    return (printable / len(sample)) >= 0.7
+
+
+def extract_from_path(filename: str, path: str) -> str:
+    """Extract text from a stored upload, reading it by path."""
+    file_path = Path(path)
+    # Sniff only the head; the full file stays on disk and the parsers
+    # read it by path, so no second in-memory copy is made.
+    with open(file_path, "rb") as f:
+        head = f.read(4096)
+    if is_probably_text(head):
+        return file_path.read_text(encoding="utf-8", errors="ignore")
+
+    ext = Path(filename).suffix.lower()
+    if ext == ".pdf":
+        # Prefer PyMuPDF: C-backed MuPDF extracts large PDFs roughly
+        # an order of magnitude faster than the pure-Python readers.
+        try:
+            import pymupdf  # type: ignore
+
+            with pymupdf.open(str(file_path)) as doc:
+                return "\n".join(page.get_text("text") for page in doc)
+        except ImportError:
+            pass
+        except Exception:  # noqa: BLE001
+            return ""
+
+        try:
+            from pypdf import PdfReader  # type: ignore
+        except Exception:  # noqa: BLE001
+            try:
+                from PyPDF2 import PdfReader  # type: ignore
+            except Exception:  # noqa: BLE001
+                PdfReader = None  # type: ignore
+
+        if PdfReader is not None:
+            try:
+                reader = PdfReader(str(file_path))
+                parts: List[str] = []
+                for page in reader.pages:
+                    text = page.extract_text() or ""
+                    if text:
+                        parts.append(text)
+                return "\n".join(parts)
+            except Exception:  # noqa: BLE001
+                return ""
+        return ""
+
+    if ext == ".docx":
+        try:
+            from docx import Document  # type: ignore
+            doc = Document(str(file_path))
+            return "\n".join(p.text for p in doc.paragraphs if p.text)
+        except Exception:  # noqa: BLE001
+            return ""
+
+    return ""
@@ -1,12 +1,29 @@
 import os
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 
-from routes import router
+from routes import router, _HTTPX
 from logreader import app as logreader_app
 from Debug import dbg, log_active_flags
-from startup import start_tunnel, print_endpoints, print_model_route
+from startup import start_tunnel, stop_tunnel, print_endpoints, print_model_route
+
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The tunnel starts on the event loop and resolves its URL from the
+    # streamed cloudflared output; running it here (instead of __main__)
+    # also covers `uvicorn Main:app` launches.
+    port = int(os.environ.get("PORT", "7860"))
+    public_url = await start_tunnel(port)
+    print_endpoints(port, public_url)
+    print_model_route()
+    yield
+    await stop_tunnel()
+    await _HTTPX.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.include_router(router)
 app.mount("/logs", logreader_app)
 
@@ -19,8 +36,19 @@ if __name__ in {"__main__", "__mp_main__"}:
     dbg("Launching server")
     log_active_flags()
 
-    public_url = start_tunnel(port)
-    print_endpoints(port, public_url)
-    print_model_route()
+    # Prefer the C-backed event loop and HTTP parser when available;
+    # fall back to uvicorn's defaults otherwise.
+    loop_impl = "uvloop"
+    try:
+        import uvloop  # type: ignore  # noqa: F401
+    except ImportError:
+        loop_impl = "auto"
+    http_impl = "httptools"
+    try:
+        import httptools  # type: ignore  # noqa: F401
+    except ImportError:
+        http_impl = "auto"
 
-    uvicorn.run(app, host=host, port=port, access_log=False)
+    uvicorn.run(
+        app, host=host, port=port, access_log=False, loop=loop_impl, http=http_impl
+    )
@@ -1,4 +1,6 @@
+import hashlib
 import os
+from collections import OrderedDict
 
 try:
     import DebugSettings  # type: ignore
@@ -34,10 +36,59 @@ def build_chat_context(history, limit=10):
     return "\n".join([f"{r.upper()}: {t}" for r, t in history[-limit:]])
 
 
-def build_prompt(file_ctx: str, search_ctx: str, web_ctx: str, chat_ctx: str):
+def build_chat_context_cached(state, limit=10):
+    """Incremental build_chat_context for a session state.
+
+    Rendered lines are kept in the state so each call formats only the
+    turns appended since the last one; the join over the trailing
+    ``limit`` lines stays cheap regardless of conversation length.
+    Falls back to a full rebuild if the history shrank (edit/reset).
+    """
+    history = state.get("history", [])
+    lines = state.setdefault("_chat_ctx_lines", [])
+    if len(lines) > len(history):
+        del lines[:]
+    for role, text in history[len(lines):]:
+        lines.append(f"{role.upper()}: {text}")
+    return "\n".join(lines[-limit:])
+
+
+# build_prompt is pure string assembly over contexts that often repeat
+# between consecutive sends; memoize on a cheap digest of the inputs.
+_PROMPT_CACHE_MAX = 32
+_prompt_cache: OrderedDict = OrderedDict()
+
+
+def _prompt_key(*parts: str) -> bytes:
+    # Length-prefix each part so the digest is unambiguous across part
+    # boundaries; a plain join would let ("x|", "y") collide with ("x", "|y").
+    h = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(4, "little"))
+        h.update(data)
+    return h.digest()
+
+
+def build_prompt(
+    file_ctx: str, location_ctx: str, search_ctx: str, web_ctx: str, chat_ctx: str
+):
+    key = _prompt_key(file_ctx, location_ctx, search_ctx, web_ctx, chat_ctx)
+    cached = _prompt_cache.get(key)
+    if cached is not None:
+        _prompt_cache.move_to_end(key)
+        return cached
+    # Sections are ordered by change frequency — static hint and file
+    # context first, per-turn search results and history last — so
+    # consecutive prompts share the longest possible byte-identical
+    # prefix and Ollama's KV/prefix cache can reuse it.
     sections = [
         section
-        for section in [file_ctx, search_ctx, web_ctx, FORMAT_HINT, chat_ctx]
+        for section in [FORMAT_HINT, file_ctx, location_ctx, search_ctx, web_ctx, chat_ctx]
         if section
     ]
-    return "\n\n".join(sections) + "\nASSISTANT:"
+    prompt = "\n\n".join(sections) + "\nASSISTANT:"
+    _prompt_cache[key] = prompt
+    if len(_prompt_cache) > _PROMPT_CACHE_MAX:
+        _prompt_cache.popitem(last=False)
+    return prompt
@@ -0,0 +1,105 @@
+"""Exact-match reply cache in front of the Ollama call.
+
+Repeat prompts (FAQs, retries, multiple users asking the same thing)
+skip the model entirely. Keys are a digest of the model name, the
+whitespace/case-normalized user prompt, and the session context the
+answer was generated from (files, location, chat history) — so a
+context-dependent answer can never leak into another session that asked
+the same words. Answers expire after a day and live in a small
+in-memory LRU backed by a sqlite table that survives restarts.
+"""
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+_DB_PATH = Path(__file__).with_name("reply_cache.db")
+_MEM_MAX = 4096
+_TTL_S = 24 * 3600
+
+_mem: OrderedDict = OrderedDict()
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+
+def _key(prompt: str, model: str, ctx: str) -> bytes:
+    normalized = " ".join(prompt.split()).lower()
+    return hashlib.blake2b(
+        model.encode("utf-8")
+        + b"|"
+        + normalized.encode("utf-8")
+        + b"|"
+        + ctx.encode("utf-8"),
+        digest_size=16,
+    ).digest()
+
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        _conn = sqlite3.connect(_DB_PATH, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS replies"
+            " (key BLOB PRIMARY KEY, answer TEXT, created_at REAL)"
+        )
+        try:
+            _conn.execute("ALTER TABLE replies ADD COLUMN created_at REAL")
+        except sqlite3.OperationalError:
+            pass  # column already present
+        _conn.commit()
+    return _conn
+
+
+def get(prompt: str, model: str, ctx: str = "") -> Optional[str]:
+    """Return a cached answer for this prompt/model/context, or None."""
+    key = _key(prompt, model, ctx)
+    cutoff = time.time() - _TTL_S
+    with _lock:
+        entry = _mem.get(key)
+        if entry is not None:
+            answer, created_at = entry
+            if created_at < cutoff:
+                del _mem[key]
+            else:
+                _mem.move_to_end(key)
+                return answer
+        try:
+            row = _db().execute(
+                "SELECT answer, created_at FROM replies WHERE key = ?", (key,)
+            ).fetchone()
+        except Exception:  # noqa: BLE001
+            return None
+        if row is None or row[1] is None or row[1] < cutoff:
+            return None
+        _mem[key] = (row[0], row[1])
+        if len(_mem) > _MEM_MAX:
+            _mem.popitem(last=False)
+        return row[0]
+
+
+def put(prompt: str, model: str, answer: str, ctx: str = "") -> None:
+    """Store an answer for this prompt/model/context."""
+    if not answer:
+        return
+    key = _key(prompt, model, ctx)
+    now = time.time()
+    with _lock:
+        _mem[key] = (answer, now)
+        if len(_mem) > _MEM_MAX:
+            _mem.popitem(last=False)
+        try:
+            _db().execute(
+                "INSERT OR REPLACE INTO replies (key, answer, created_at)"
+                " VALUES (?, ?, ?)",
+                (key, answer, now),
+            )
+            _db().execute(
+                "DELETE FROM replies WHERE created_at IS NULL OR created_at < ?",
+                (now - _TTL_S,),
+            )
+            _db().commit()
+        except Exception:  # noqa: BLE001
+            pass
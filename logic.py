@@ -2,10 +2,11 @@ import re
 import time
 import json
 import hashlib
+from datetime import datetime
 from pathlib import Path
 
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Tuple
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
 
 from Search import perform_search
 from WebAccess import bravery_search
@@ -24,7 +25,7 @@ def split_thinking(text: str):
 
 # ---------------- Dynamic routing ("thinking") ----------------
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Signals:
     ambiguity: float
     needs_search: float
@@ -73,8 +74,8 @@ def compute_signals(prompt: str) -> Signals:
         needs_tool = max(needs_tool, 0.9)
         tool_name = "time"
 
-    # Search likelihood (reuse your existing heuristic)
-    needs_search = 1.0 if _needs_search(prompt) else 0.0
+    # Search likelihood (reuse your existing heuristic); t is already lowered.
+    needs_search = 1.0 if _needs_search_lower(t) else 0.0
 
     return Signals(
         ambiguity=ambiguity,
@@ -84,10 +85,10 @@ def compute_signals(prompt: str) -> Signals:
     )
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Step:
     action: str  # "clarify" | "tool" | "search" | "respond"
-    args: Dict[str, str] = field(default_factory=dict)
+    args: Tuple[Tuple[str, str], ...] = ()
 
 
 def make_dynamic_plan(prompt: str) -> List[Step]:
@@ -100,7 +101,7 @@ def make_dynamic_plan(prompt: str) -> List[Step]:
 
     # 2) Tools have highest priority when strongly detected.
     if s.needs_tool >= 0.75 and s.tool_name:
-        return [Step("tool", {"tool": s.tool_name, "input": prompt}), Step("respond")]
+        return [Step("tool", (("tool", s.tool_name), ("input", prompt))), Step("respond")]
 
     # 3) Otherwise consider searching when the heuristic says it would help.
     if s.needs_search >= 0.5:
@@ -126,7 +127,8 @@ def run_tool(tool: str, user_input: str) -> Tuple[str, Optional[str]]:
     tool = tool.lower().strip()
 
     if tool == "time":
-        return time.strftime("%Y-%m-%d %H:%M:%S"), None
+        # isoformat is C-implemented and skips the strftime format-string parse.
+        return datetime.now().isoformat(sep=" ", timespec="seconds"), None
 
     if tool == "calculator":
         # Extract a basic arithmetic expression after common prefixes.
@@ -163,8 +165,9 @@ def dynamic_think_and_gather(prompt: str, web_url: str, deadline: float):
 
         if step.action == "tool":
             _t = time.perf_counter()
-            tool_name = step.args.get("tool", "")
-            tool_result, err = run_tool(tool_name, step.args.get("input", ""))
+            args = dict(step.args)
+            tool_name = args.get("tool", "")
+            tool_result, err = run_tool(tool_name, args.get("input", ""))
             add_timing(f"tool:{tool_name}", time.perf_counter() - _t)
             if err:
                 add_error(err)
@@ -172,9 +175,10 @@ def dynamic_think_and_gather(prompt: str, web_url: str, deadline: float):
             set_debug("tool", {"tool": tool_name, "result": tool_result, "error": err})
 
         if step.action == "search":
-            # Defer to existing search machinery
+            # Defer to existing search machinery; compute the remaining budget
+            # once here instead of re-deriving it from the deadline inside.
             search_context, web_context, timed_out, search_error = gather_context(
-                prompt, web_url, deadline
+                prompt, web_url, deadline - time.monotonic()
             )
             # If gather_context already timed out or errored, bubble it up
             if search_error:
@@ -186,9 +190,10 @@ def dynamic_think_and_gather(prompt: str, web_url: str, deadline: float):
     return ("tool" if tool_result is not None else "direct"), "", "", False, error, tool_result
 
 
-def gather_context(prompt: str, web_url: str, deadline: float):
+def gather_context(prompt: str, web_url: str, remaining_s: float):
     """Search-only context gatherer.
-    Run search and return search_context, web_context, timed_out.
+    Run search (within the remaining time budget, in seconds) and return
+    search_context, web_context, timed_out.
     Also records debug info and sets evidence for downstream use.
     """
     state = get_state()
@@ -216,20 +221,20 @@ def gather_context(prompt: str, web_url: str, deadline: float):
     )
 
     if should_search:
-        remaining = deadline - time.monotonic()
-        if remaining <= 0:
+        if remaining_s <= 0:
             timed_out = True
             search_error = "Search time budget exceeded before starting."
         else:
+            timeout = min(30, int(remaining_s))
             _t_search = time.perf_counter()
             dbg("Searching the web (Bravery)…")
             search_results, search_error = bravery_search(
-                effective_query, max_results=10, timeout=min(30, int(remaining))
+                effective_query, max_results=10, timeout=timeout
             )
             # fallback to legacy search if Brave isn't configured
             if search_error and not search_results:
                 fallback_results, fallback_error = perform_search(
-                    effective_query, max_results=10, timeout=min(30, int(remaining))
+                    effective_query, max_results=10, timeout=timeout
                 )
                 if fallback_results:
                     search_results = fallback_results
@@ -241,7 +246,9 @@ def gather_context(prompt: str, web_url: str, deadline: float):
             if search_error:
                 add_error(str(search_error))
             dbg(f"Search returned {len(search_results)} result(s)")
-            _store_search_cache(state, effective_query, search_results)
+            if search_results or not search_error:
+                # Don't cache failures; a retry should hit the network again.
+                _store_search_cache(state, effective_query, search_results)
     elif use_search:
         dbg("Search skipped: heuristic judged prompt answerable without web search.")
 
@@ -273,12 +280,29 @@ def _augment_query_with_location(prompt: str, state: dict) -> str:
     return text
 
 
+# Shared across sessions: repeated prompts (retries, re-renders) skip the
+# HTTP round-trip entirely while the entry is fresh.
+SEARCH_CACHE_TTL_S = 120
+SEARCH_CACHE_MAX = 256
+_SEARCH_CACHE: dict = {}  # normalized query -> (ts, results)
+
+
 def _get_cached_search(state: dict, query: str):
     """Return cached results for a query if present and recent."""
     key = _normalize_query(query)
+    now = time.time()
+    cached = _SEARCH_CACHE.get(key)
+    if cached is not None:
+        ts, results = cached
+        if now - ts <= SEARCH_CACHE_TTL_S:
+            return results
+        del _SEARCH_CACHE[key]
     history = state.get("search_history") or []
     for entry in reversed(history):
         if entry.get("query") == key:
+            ts = entry.get("ts")
+            if ts is not None and now - ts > SEARCH_CACHE_TTL_S:
+                continue
             return entry.get("results", [])
     # Fall back to disk cache
     cached = _load_search_cache(key)
@@ -293,9 +317,15 @@ def _store_search_cache(state: dict, query: str, results: list):
         state["search_history"] = []
         history = state["search_history"]
     key = _normalize_query(query)
-    history.append({"query": key, "results": results, "ts": time.time()})
+    now = time.time()
+    history.append({"query": key, "results": results, "ts": now})
     if len(history) > 20:
         del history[0: len(history) - 20]
+    if len(_SEARCH_CACHE) >= SEARCH_CACHE_MAX:
+        # Drop the stalest entry to stay bounded.
+        oldest = min(_SEARCH_CACHE, key=lambda k: _SEARCH_CACHE[k][0])
+        del _SEARCH_CACHE[oldest]
+    _SEARCH_CACHE[key] = (now, results)
     _save_search_cache(key, results)
 
 
@@ -336,8 +366,11 @@ def _save_search_cache(query_key: str, results: list):
 
 def _needs_search(prompt: str) -> bool:
     """Lightweight heuristic to decide if web search is helpful."""
-    text = prompt.lower()
+    return _needs_search_lower(prompt.lower())
+
 
+def _needs_search_lower(text: str) -> bool:
+    """Same heuristic, taking an already-lowercased prompt to avoid re-lowering."""
     # Topics that usually need fresh data
     fresh_keywords = [
         "today",
@@ -3,13 +3,18 @@ import asyncio
 import time
 from pathlib import Path
 from fastapi import FastAPI
-from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+import orjson
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
 
 app = FastAPI()
 
 ROOT = Path(__file__).parent
 LOG_DIR = ROOT / "Logs" / "run_active"
 
+# Resolve each known log path once at import; handlers are hit on every
+# autorefresh tick and shouldn't rebuild Path objects per request.
+_LOG_PATHS = {name: LOG_DIR / f"{name}.log" for name in ("localchat", "ollama", "cloudflared")}
+
 
 def _read_log(path: Path, max_lines: int = 500) -> str:
     if not path.exists():
@@ -21,12 +26,8 @@ def _read_log(path: Path, max_lines: int = 500) -> str:
         return ""
 
 
-def _resolve_log_path(name: str) -> Path:
-    name = name.lower()
-    if name not in {"localchat", "ollama", "cloudflared"}:
-        return Path()
-    path = LOG_DIR / f"{name}.log"
-    return path
+def _resolve_log_path(name: str) -> Path | None:
+    return _LOG_PATHS.get(name.lower())
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -123,7 +124,7 @@ async def index() -> HTMLResponse:
   <section class="viewer">
     <div class="toolbar">
       <div id="status">Idle</div>
-      <label><input id="autorefresh" type="checkbox" checked /> Auto refresh (2s)</label>
+      <label><input id="autorefresh" type="checkbox" checked /> Auto refresh (on change)</label>
     </div>
     <div id="content" class="content">Select a log…</div>
   </section>
@@ -188,26 +189,28 @@ async def index() -> HTMLResponse:
 
 
 @app.get("/api/logs/{name}")
-async def read_log(name: str) -> JSONResponse:
-    name = name.lower()
-    if name not in {"localchat", "ollama", "cloudflared"}:
-        return JSONResponse({"text": "", "path": ""})
+async def read_log(name: str) -> Response:
+    # orjson serializes the multi-KB log tail in C instead of escaping it
+    # character-by-character through the stdlib encoder.
     path = _resolve_log_path(name)
+    if path is None:
+        return Response(orjson.dumps({"text": "", "path": ""}), media_type="application/json")
     text = _read_log(path)
-    return JSONResponse({"text": text, "path": str(path)})
+    return Response(
+        orjson.dumps({"text": text, "path": str(path)}), media_type="application/json"
+    )
 
 
 @app.get("/api/logs_watch/{name}")
 async def watch_log(name: str) -> StreamingResponse:
-    name = name.lower()
+    path = _resolve_log_path(name)
 
     async def event_stream():
-        path = _resolve_log_path(name)
         last_mtime = 0.0
         last_emit = 0.0
         while True:
             try:
-                mtime = path.stat().st_mtime if path and path.exists() else 0.0
+                mtime = path.stat().st_mtime if path.exists() else 0.0
                 if not last_mtime:
                     last_mtime = mtime
                 elif mtime and mtime > last_mtime:
@@ -220,7 +223,7 @@ async def watch_log(name: str) -> StreamingResponse:
             except Exception:
                 await asyncio.sleep(1.0)
 
-    if name not in {"localchat", "ollama", "cloudflared"}:
+    if path is None:
         return StreamingResponse(iter(()), media_type="text/event-stream")
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
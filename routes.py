@@ -1,33 +1,54 @@
 import asyncio
+import hashlib
 import json
-import threading
+import os
 import time
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
 
-import requests
+import aiofiles
+import orjson
+
+import httpx
 from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
-from io import BytesIO
+from fastapi.concurrency import run_in_threadpool
 from pathlib import Path
 import uuid
 from fastapi.responses import HTMLResponse, StreamingResponse, Response
+from pydantic import BaseModel
+from watchfiles import awatch
+
+from Prompt import build_prompt, build_chat_context_cached
+try:
+    from Debug import (
+        DEBUG_ENABLED,
+        init_debug,
+        set_prompt,
+        attach_state,
+        dbg,
+        add_error,
+        add_timing,
+        set_debug,
+    )
+except ImportError:  # debug module stripped from a deployment
+    DEBUG_ENABLED = False
 
-from Prompt import build_prompt, build_chat_context
-from Debug import (
-    init_debug,
-    set_prompt,
-    attach_state,
-    dbg,
-    add_error,
-    add_timing,
-    set_debug,
-)
+    def _debug_noop(*args, **kwargs):
+        return None
+
+    init_debug = set_prompt = attach_state = _debug_noop
+    dbg = add_error = add_timing = set_debug = _debug_noop
+from Extract import extract_from_path
 from Model import SEARCH_TIME_BUDGET, get_ollama_endpoint
 from logic import split_thinking, gather_context
+import cache as reply_cache
 from uiconfig import HTML_TEMPLATE, ensure_html_exists
 from logreader import read_log as read_log_api
 from sid_create import (
     get_state,
-    save_session,
+    schedule_save,
+    append_history,
     list_session_ids,
     delete_session as delete_session_store,
     create_session,
@@ -37,23 +58,116 @@ router = APIRouter()
 UPLOADS_DIR = Path(__file__).with_name("uploads")
 UPLOADS_DIR.mkdir(exist_ok=True)
 
+# Ceiling for the combined extracted text carried into every prompt.
+_FILE_CTX_MAX = 200 * 1024
 
-@router.get("/favicon.ico", include_in_schema=False)
-async def favicon() -> Response:
-    """Serve a lightweight embedded favicon to avoid 404s."""
-    svg = """<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 64 64'>
+# Workers spawn lazily on first submit; Extract is a leaf module, so the
+# children never import the app (or probe Ollama) on startup.
+_EXTRACT_POOL = ProcessPoolExecutor(max_workers=os.cpu_count())
+
+# One pooled async client per process for Ollama calls: keep-alive skips
+# the per-request TCP handshake, and tokens are read on the event loop,
+# so no worker thread or cross-thread queue is needed.
+_HTTPX = httpx.AsyncClient(
+    timeout=httpx.Timeout(connect=5, read=300, write=10, pool=5),
+    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+)
+
+# The USER LOCATION line rarely changes between sends; memoize the
+# formatted string on the raw fields so both send paths share one build.
+_loc_ctx_cache: dict = {}
+
+
+def _location_context(state) -> str:
+    loc = state.get("user_location") or {}
+    if not (isinstance(loc, dict) and loc.get("lat") is not None and loc.get("lon") is not None):
+        return ""
+    key = (loc.get("lat"), loc.get("lon"), loc.get("accuracy"), loc.get("timestamp"))
+    ctx = _loc_ctx_cache.get(key)
+    if ctx is None:
+        parts = [f"lat={key[0]}", f"lon={key[1]}"]
+        if key[2] is not None:
+            parts.append(f"accuracy_m={key[2]}")
+        if key[3]:
+            parts.append(f"timestamp={key[3]}")
+        ctx = "USER LOCATION: " + ", ".join(parts)
+        if len(_loc_ctx_cache) > 64:
+            _loc_ctx_cache.clear()
+        _loc_ctx_cache[key] = ctx
+    return ctx
+
+
+# Pool of accumulation buffers reused across sends: a long answer grows
+# a bytearray once and the next request inherits that capacity instead of
+# re-growing from empty. Bounded so idle buffers don't pin memory.
+_BUF_POOL: deque = deque(maxlen=32)
+
+
+def _acquire_buf() -> bytearray:
+    try:
+        return _BUF_POOL.pop()
+    except IndexError:
+        return bytearray()
+
+
+def _release_buf(buf: bytearray) -> None:
+    buf.clear()
+    _BUF_POOL.append(buf)
+
+
+# Constant fragments for the streaming frames: only the token payload is
+# serialized per frame; the envelope never changes. orjson.dumps of a bare
+# str/list is its fastest path.
+_TOKEN_PREFIX = b'{"type":"token","text":'
+_TOKENS_PREFIX = b'{"type":"tokens","texts":'
+_FRAME_SUFFIX = b"}\n"
+
+# Built once: browsers hammer the favicon and the body never changes.
+_FAVICON_SVG = b"""<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 64 64'>
 <circle cx='32' cy='32' r='30' fill='#0c98c7' stroke='#0b1d30' stroke-width='4'/>
 <circle cx='32' cy='26' r='10' fill='#0b1d30'/>
 <path d='M16 52c4-14 14-18 16-18s12 4 16 18' fill='#0b1d30'/>
 </svg>"""
-    return Response(content=svg, media_type="image/svg+xml")
+_FAVICON_ETAG = '"' + hashlib.blake2b(_FAVICON_SVG, digest_size=8).hexdigest() + '"'
+_FAVICON_RESPONSE = Response(
+    content=_FAVICON_SVG,
+    media_type="image/svg+xml",
+    headers={
+        "Cache-Control": "public, max-age=604800, immutable",
+        "ETag": _FAVICON_ETAG,
+    },
+)
+_FAVICON_304 = Response(
+    status_code=304,
+    headers={
+        "Cache-Control": "public, max-age=604800, immutable",
+        "ETag": _FAVICON_ETAG,
+    },
+)
+
+# index.html cached in memory, revalidated with a single stat so live
+# edits (picked up by /api/index_watch) still serve fresh HTML. The
+# template is materialized once here instead of per request.
+ensure_html_exists()
+_index_cache = {"mtime": 0.0, "html": ""}
+
+
+@router.get("/favicon.ico", include_in_schema=False)
+async def favicon(request: Request) -> Response:
+    """Serve a lightweight embedded favicon to avoid 404s."""
+    if request.headers.get("if-none-match") == _FAVICON_ETAG:
+        return _FAVICON_304
+    return _FAVICON_RESPONSE
 
 
 @router.get("/", response_class=HTMLResponse)
 async def index() -> HTMLResponse:
     """Serve the lightweight HTML shell."""
-    ensure_html_exists()
-    return HTMLResponse(HTML_TEMPLATE.read_text(encoding="utf-8"))
+    mtime = HTML_TEMPLATE.stat().st_mtime
+    if mtime != _index_cache["mtime"]:
+        _index_cache["html"] = HTML_TEMPLATE.read_text(encoding="utf-8")
+        _index_cache["mtime"] = mtime
+    return HTMLResponse(_index_cache["html"])
 
 
 @router.get("/api/sessions")
@@ -73,22 +187,54 @@ async def create_session_endpoint():
 async def delete_session(session_id: str):
     """Delete a session from memory and disk."""
     sid = delete_session_store(session_id)
+    _hist_enc.pop(session_id, None)
+    _job_locks.pop(session_id, None)
     return {"deleted": sid}
 
 
+# Per-session locks serializing mutations of state["jobs"] between the
+# endpoint handlers and the async workers. Kept in a module dict rather
+# than the state because an asyncio.Lock isn't JSON-serializable.
+_job_locks: dict = {}
+
+
+def _job_lock(session_id: str) -> asyncio.Lock:
+    lock = _job_locks.get(session_id)
+    if lock is None:
+        lock = _job_locks[session_id] = asyncio.Lock()
+    return lock
+
+
+# Strong references to detached worker tasks: asyncio only keeps weak
+# refs to running tasks, so a task referenced nowhere else can be
+# garbage-collected mid-execution.
+_bg_tasks: set = set()
+
+
+# /api/history is polled by the frontend; cache the encoded body per
+# session and reuse it while the history length is unchanged. Lives in a
+# module dict (not the state) so it never leaks into the saved JSON.
+_hist_enc: dict = {}
+
+
 @router.get("/api/history")
 async def history(session_id: str):
     state = get_state(session_id)
     attach_state(state)
-    dbg(f"History requested for session {session_id}")
-    return {"history": state["history"]}
+    dbg("History requested for session %s", session_id)
+    history = state["history"]
+    cached = _hist_enc.get(session_id)
+    if cached is None or cached[0] != len(history):
+        cached = (len(history), orjson.dumps({"history": history}))
+        _hist_enc[session_id] = cached
+    return Response(cached[1], media_type="application/json")
 
 
 @router.get("/api/debug")
 async def debug_panel(session_id: str):
     state = get_state(session_id)
     attach_state(state)
-    dbg(f"Debug requested for session {session_id}")
+    dbg("Debug requested for session %s", session_id)
     return {
         "dbg_log": state.get("dbg_log", []),
         "dbg_errors": state.get("dbg_errors", []),
@@ -103,7 +249,6 @@ async def debug_panel(session_id: str):
 @router.get("/api/index_mtime")
 async def index_mtime():
     try:
-        ensure_html_exists()
         path = Path(__file__).with_name("index.html")
         if not path.exists():
             return {"mtime": 0}
@@ -112,23 +257,37 @@ async def index_mtime():
         return {"mtime": 0}
 
 
+# One inotify-backed watcher (watchfiles) fans change events out to all
+# connected clients, replacing a 0.5s stat() poll loop per connection.
+_index_subscribers: set = set()
+_index_watcher_task: Optional[asyncio.Task] = None
+
+
+async def _index_watcher() -> None:
+    path = Path(__file__).with_name("index.html")
+    try:
+        async for _ in awatch(path):
+            mtime = path.stat().st_mtime if path.exists() else 0.0
+            for q in list(_index_subscribers):
+                q.put_nowait(mtime)
+    except Exception:  # noqa: BLE001
+        pass
+
+
 @router.get("/api/index_watch")
 async def index_watch():
     async def event_stream():
-        ensure_html_exists()
-        path = Path(__file__).with_name("index.html")
-        last_mtime = 0.0
-        while True:
-            try:
-                mtime = path.stat().st_mtime if path.exists() else 0.0
-                if not last_mtime:
-                    last_mtime = mtime
-                elif mtime and mtime > last_mtime:
-                    last_mtime = mtime
-                    yield f"data: {json.dumps({'mtime': mtime})}\n\n"
-                await asyncio.sleep(0.5)
-            except Exception:  # noqa: BLE001
-                await asyncio.sleep(1.0)
+        global _index_watcher_task
+        if _index_watcher_task is None or _index_watcher_task.done():
+            _index_watcher_task = asyncio.create_task(_index_watcher())
+        q: asyncio.Queue = asyncio.Queue()
+        _index_subscribers.add(q)
+        try:
+            while True:
+                mtime = await q.get()
+                yield f"data: {json.dumps({'mtime': mtime})}\n\n"
+        finally:
+            _index_subscribers.discard(q)
 
     return StreamingResponse(event_stream(), media_type="text/event-stream")
 
@@ -148,77 +307,44 @@ async def upload_files(
         safe = "".join(c for c in base if c.isalnum() or c in "._- ")
         return safe or "upload.bin"
 
-    def is_probably_text(data: bytes) -> bool:
-        if not data:
-            return True
-        sample = data[:4096]
-        if b"\x00" in sample:
-            return False
-        printable = 0
-        for b in sample:
-            if b in (9, 10, 13) or 32 <= b <= 126:
-                printable += 1
-        return (printable / len(sample)) >= 0.7
-
-    def extract_text(filename: str, content: bytes) -> str:
-        if is_probably_text(content):
-            return content.decode("utf-8", errors="ignore")
-
-        ext = Path(filename).suffix.lower()
-        if ext == ".pdf":
-            try:
-                from pypdf import PdfReader  # type: ignore
-            except Exception:  # noqa: BLE001
-                try:
-                    from PyPDF2 import PdfReader  # type: ignore
-                except Exception:  # noqa: BLE001
-                    PdfReader = None  # type: ignore
-
-            if PdfReader is not None:
-                try:
-                    reader = PdfReader(BytesIO(content))
-                    parts: List[str] = []
-                    for page in reader.pages:
-                        text = page.extract_text() or ""
-                        if text:
-                            parts.append(text)
-                    return "\n".join(parts)
-                except Exception:  # noqa: BLE001
-                    return ""
-            return ""
-
-        if ext == ".docx":
-            try:
-                from docx import Document  # type: ignore
-                doc = Document(BytesIO(content))
-                return "\n".join(p.text for p in doc.paragraphs if p.text)
-            except Exception:  # noqa: BLE001
-                return ""
-
-        return ""
-
     state = get_state(session_id)
     attach_state(state)
-    dbg(f"Upload received: {len(files)} files for session {session_id}")
+    dbg("Upload received: %d files for session %s", len(files), session_id)
     count = 0
     skipped: List[str] = []
     stored: List[str] = []
     state.setdefault("uploaded_files", [])
     session_dir = UPLOADS_DIR / session_id
     session_dir.mkdir(parents=True, exist_ok=True)
+    # Extracted text lives in a content-hash-keyed map so re-uploading the
+    # same bytes never re-extracts or duplicates context.
+    files_map = state.setdefault("files", {})
+    if not files_map and state.get("file_context"):
+        # Sessions from before the map: keep their accumulated context as
+        # one entry so it survives the rebuild below.
+        legacy = state["file_context"]
+        files_map["legacy"] = {"name": "(earlier uploads)", "text": legacy, "size": len(legacy)}
     for file in files:
-        content = await file.read()
         safe_name = sanitize_filename(file.filename)
         file_path = session_dir / safe_name
         try:
-            file_path.write_bytes(content)
+            # Stream to disk in 1MB chunks: memory stays flat for large
+            # PDFs and the event loop never blocks on a sync write. The
+            # content hash comes along for free on the same pass.
+            size = 0
+            hasher = hashlib.blake2b(digest_size=16)
+            async with aiofiles.open(file_path, "wb") as out:
+                while chunk := await file.read(1 << 20):
+                    await out.write(chunk)
+                    hasher.update(chunk)
+                    size += len(chunk)
             stored.append(safe_name)
             state["uploaded_files"].append(
                 {
                     "name": file.filename,
                     "stored_name": safe_name,
                     "path": str(file_path),
-                    "size": len(content),
+                    "size": size,
                     "content_type": file.content_type,
                 }
             )
@@ -226,18 +352,43 @@ async def upload_files(
             skipped.append(file.filename)
             continue
 
-        extracted = extract_text(file.filename, content).strip()
+        digest = hasher.hexdigest()
+        if digest in files_map:
+            # Identical content already extracted: refresh its slot (name
+            # and recency) and skip the parse entirely.
+            entry = files_map.pop(digest)
+            entry["name"] = file.filename
+            files_map[digest] = entry
+            dbg("Duplicate upload skipped: %s", file.filename)
+            continue
+
+        # Decoding / PDF / docx parsing is CPU-bound; a process pool keeps
+        # it off the event loop and scales concurrent uploads with cores.
+        extracted = (
+            await asyncio.get_running_loop().run_in_executor(
+                _EXTRACT_POOL, extract_from_path, file.filename, str(file_path)
+            )
+        ).strip()
         if extracted:
-            state["file_context"] += f"FILE {file.filename}:\n{extracted}\n\n"
             count += 1
-        else:
-            state["file_context"] += (
-                f"FILE {file.filename}:\n[stored, no text extracted]\n\n"
-            )
-    file_count = len(
-        [chunk for chunk in state["file_context"].split("FILE ") if chunk.strip()]
+        files_map[digest] = {
+            "name": file.filename,
+            "text": extracted or "[stored, no text extracted]",
+            "size": size,
+        }
+
+    # Cap the combined context, evicting the oldest entries first (dicts
+    # keep insertion order; the refresh above keeps re-uploads recent).
+    total = sum(len(f["text"]) for f in files_map.values())
+    while total > _FILE_CTX_MAX and len(files_map) > 1:
+        oldest = next(iter(files_map))
+        total -= len(files_map.pop(oldest)["text"])
+
+    state["file_context"] = "\n\n".join(
+        f"FILE {f['name']}:\n{f['text']}" for f in files_map.values()
     )
-    save_session(session_id, state)
+    file_count = len(files_map)
+    schedule_save(session_id, state)
     return {
         "loaded_files": count,
         "total_files": file_count,
@@ -246,14 +397,28 @@ async def upload_files(
     }
 
 
+class LocationModel(BaseModel):
+    lat: float
+    lon: float
+    accuracy: Optional[float] = None
+    timestamp: Optional[str] = None
+
+
+class SendPayload(BaseModel):
+    prompt: str
+    session_id: str = ""
+    use_search: bool = False
+    location: Optional[LocationModel] = None
+    location_failed: bool = False
+
+
 @router.post("/api/send")
-async def send(request: Request):
-    payload = await request.json()
-    prompt: str = (payload.get("prompt") or "").strip()
-    session_id: str = payload.get("session_id") or ""
-    use_search: bool = bool(payload.get("use_search", False))
-    location = payload.get("location")
-    location_failed = bool(payload.get("location_failed", False))
+async def send(payload: SendPayload):
+    # pydantic-core parses and validates the body once; the handler is
+    # straight-line field reads from there.
+    prompt = payload.prompt.strip()
+    session_id = payload.session_id
+    use_search = payload.use_search
 
     if not prompt:
         raise HTTPException(status_code=400, detail="prompt is required")
@@ -261,246 +426,274 @@ async def send(request: Request):
     state = get_state(session_id)
     attach_state(state)
     init_debug(state)
-    dbg(f"Send called session={session_id} prompt_len={len(prompt)} use_search={use_search}")
-    if location_failed:
+    dbg("Send called session=%s prompt_len=%d use_search=%s", session_id, len(prompt), use_search)
+    if payload.location_failed:
         use_search = False
     state["use_search"] = use_search
     state["auto_fetch_top_result"] = use_search
-    if isinstance(location, dict) and location.get("lat") is not None and location.get("lon") is not None:
-        state["user_location"] = location
-    elif location is None:
-        # Keep existing location unless explicitly cleared.
-        pass
-    else:
-        state["user_location"] = None
+    if payload.location is not None:
+        state["user_location"] = payload.location.model_dump()
 
+    # The stream's finalization saves once; intermediate saves here would
+    # only re-serialize the same state a debounce window earlier.
     state["history"].append(("user", prompt))
-    save_session(session_id, state)
-
-    loop = asyncio.get_running_loop()
-    queue: asyncio.Queue = asyncio.Queue()
-    acc_parts: List[str] = []
-    result = {
-        "acc": "",
-        "thinking": "",
-        "answer": "",
-        "has_thinking": False,
-        "saved": False,
-    }
+    append_history(session_id, "user", prompt)
+
     request_id = uuid.uuid4().hex
     state.setdefault("pending_requests", {})
     state.setdefault("jobs", {})
-    state["pending_requests"][request_id] = {
-        "prompt": prompt,
-        "started_at": time.time(),
-    }
-    state["jobs"][request_id] = {
-        "id": request_id,
-        "prompt": prompt,
-        "status": "running",
-        "started_at": time.time(),
-        "updated_at": time.time(),
-        "answer": "",
-        "raw": "",
-        "thinking": "",
-        "error": "",
-    }
-    dbg(
-        "job id created "
-        + json.dumps(
-            {
-                "id": request_id,
-                "status": "running",
-                "started_at": state["jobs"][request_id]["started_at"],
-                "prompt_len": len(prompt),
-            }
-        )
-    )
-    save_session(session_id, state)
-
-    def push_status(text: str):
-        asyncio.run_coroutine_threadsafe(
-            queue.put({"type": "status", "text": text}), loop
+    async with _job_lock(session_id):
+        state["pending_requests"][request_id] = {
+            "prompt": prompt,
+            "started_at": time.time(),
+        }
+        state["jobs"][request_id] = {
+            "id": request_id,
+            "prompt": prompt,
+            "status": "running",
+            "started_at": time.time(),
+            "updated_at": time.time(),
+            "answer": "",
+            "raw": "",
+            "thinking": "",
+            "error": "",
+        }
+    if DEBUG_ENABLED:
+        dbg(
+            "job id created "
+            + orjson.dumps(
+                {
+                    "id": request_id,
+                    "status": "running",
+                    "started_at": state["jobs"][request_id]["started_at"],
+                    "prompt_len": len(prompt),
+                }
+            ).decode()
         )
 
-    push_status("Preparing request…")
+    # Status breadcrumbs used to ride the worker queue without ever being
+    # forwarded to the client; keep them as plain debug log entries.
+    dbg("Preparing request…")
     if use_search:
-        push_status("Searching for data…")
+        dbg("Searching for data…")
     else:
-        push_status("Skipping search; compiling context…")
+        dbg("Skipping search; compiling context…")
 
-    deadline = time.monotonic() + SEARCH_TIME_BUDGET
-    search_context, web_context, timed_out, search_error = gather_context(
-        prompt, "", deadline
+    # Search can block on HTTP for a long time; run it in the threadpool so
+    # the event loop stays free, and do the cheap prompt prep while it runs.
+    search_task = asyncio.create_task(
+        run_in_threadpool(gather_context, prompt, "", SEARCH_TIME_BUDGET)
     )
+
+    chat_context = build_chat_context_cached(state)
+    file_ctx = state.get("file_context", "")
+    location_ctx = _location_context(state)
+    # The session contexts are part of the cache key: the same words with
+    # different files/history/location must never share an answer.
+    cache_ctx = "\x00".join((file_ctx, location_ctx, chat_context))
+
+    search_context, web_context, timed_out, search_error = await search_task
     set_debug("search_error", search_error)
     if search_error:
         add_error(search_error)
     if timed_out:
         dbg("Search timed out before completion")
-    push_status("Building prompt…")
-
-    chat_context = build_chat_context(state["history"])
-    file_ctx = state.get("file_context", "")
-    loc = state.get("user_location") or {}
-    location_ctx = ""
-    if isinstance(loc, dict) and loc.get("lat") is not None and loc.get("lon") is not None:
-        parts = [f"lat={loc.get('lat')}", f"lon={loc.get('lon')}"]
-        if loc.get("accuracy") is not None:
-            parts.append(f"accuracy_m={loc.get('accuracy')}")
-        if loc.get("timestamp"):
-            parts.append(f"timestamp={loc.get('timestamp')}")
-        location_ctx = "USER LOCATION: " + ", ".join(parts)
-    if location_ctx:
-        file_ctx = f"{location_ctx}\n\n{file_ctx}" if file_ctx else location_ctx
+    dbg("Building prompt…")
 
     full_prompt = build_prompt(
-        file_ctx, search_context, web_context, chat_context
+        file_ctx, location_ctx, search_context, web_context, chat_context
     )
     set_prompt(full_prompt)
 
-    def model_worker():
+    # The preamble frames are fully known before streaming starts; encode
+    # them once here so the generator begins with a single ready blob.
+    preamble = orjson.dumps({"type": "job", "job_id": request_id}) + b"\n"
+    if search_error:
+        preamble += orjson.dumps(
+            {
+                "type": "notice",
+                "text": f"Search unavailable: {search_error}",
+            }
+        ) + b"\n"
+    if timed_out:
+        preamble += orjson.dumps(
+            {
+                "type": "notice",
+                "text": f"Search/fetch capped at {SEARCH_TIME_BUDGET // 60} minute(s).",
+            }
+        ) + b"\n"
+
+    async def event_stream():
+        # One growing byte buffer instead of thousands of small str objects
+        # kept alive in a list for the whole generation.
+        acc_buf = _acquire_buf()
+        token_count = 0
+        failed = False
+        cache_hit = False
+        model = ""
+        # Cleared once streaming ran to completion (or to a handled
+        # error); left True when the client disconnects and
+        # GeneratorExit/CancelledError lands on a yield below.
+        interrupted = True
         try:
-            generate_url, headers, model = get_ollama_endpoint()
-            dbg(f"Streaming request to model={model} url={generate_url}")
-            push_status("Generating response…")
-            with requests.post(
-                generate_url,
-                json={"model": model, "prompt": full_prompt, "stream": True},
-                stream=True,
-                timeout=300,
-                headers=headers,
-            ) as r:
-                r.raise_for_status()
-                for line in r.iter_lines(decode_unicode=True):
-                    if not line:
-                        continue
-                    data = json.loads(line)
-                    chunk = data.get("response", "")
-                    if chunk:
-                        acc_parts.append(chunk)
-                        if len(acc_parts) % 50 == 0:
-                            dbg(f"Streaming progress: {len(acc_parts)} chunks")
-                        asyncio.run_coroutine_threadsafe(
-                            queue.put({"type": "token", "text": chunk}), loop
-                        )
-                    if data.get("done"):
-                        break
-        except Exception as e:  # noqa: BLE001
-            asyncio.run_coroutine_threadsafe(
-                queue.put({"type": "error", "text": str(e)}), loop
-            )
-            add_error(str(e))
-            state["jobs"][request_id]["status"] = "error"
-            state["jobs"][request_id]["error"] = str(e)
-            state["jobs"][request_id]["updated_at"] = time.time()
-            dbg(
-                "job id task ended "
-                + json.dumps(
-                    {
-                        "id": request_id,
-                        "status": "error",
-                        "updated_at": state["jobs"][request_id]["updated_at"],
-                        "error": str(e),
-                    }
-                )
+            yield preamble
+
+            # The endpoint probe does blocking HTTP version checks (with a
+            # sleep/retry loop when the daemon is down); keep it off the
+            # event loop so a slow probe can't stall every session.
+            generate_url, headers, model = await run_in_threadpool(get_ollama_endpoint)
+            # Repeat prompts skip the model entirely; search-backed turns
+            # are excluded since their answers depend on live results.
+            # The cache does sqlite I/O, so it runs in the threadpool like
+            # the probe above.
+            cached_answer = (
+                None
+                if use_search
+                else await run_in_threadpool(reply_cache.get, prompt, model, cache_ctx)
             )
+            if cached_answer is not None:
+                cache_hit = True
+                dbg("Reply cache hit")
+                acc_buf += cached_answer.encode("utf-8")
+                yield _TOKEN_PREFIX + orjson.dumps(cached_answer) + _FRAME_SUFFIX
+            if not cache_hit:
+                dbg("Streaming request to model=%s url=%s", model, generate_url)
+                dbg("Generating response…")
+                async with _HTTPX.stream(
+                    "POST",
+                    generate_url,
+                    json={"model": model, "prompt": full_prompt, "stream": True},
+                    headers=headers,
+                ) as r:
+                    r.raise_for_status()
+                    buf = bytearray()
+                    done = False
+                    # aiter_raw skips httpx's content-decoding layer; Ollama
+                    # streams uncompressed NDJSON so the bytes pass straight
+                    # into the line splitter. No chunk_size: an explicit one
+                    # makes httpx buffer until that many bytes arrive, which
+                    # would hold every token back until the reply ends.
+                    async for raw in r.aiter_raw():
+                        buf += raw
+                        # Collect every complete NDJSON line in this network read.
+                        texts: List[str] = []
+                        start = 0
+                        while True:
+                            nl = buf.find(b"\n", start)
+                            if nl < 0:
+                                break
+                            line = bytes(buf[start:nl])
+                            start = nl + 1
+                            if not line:
+                                continue
+                            data = orjson.loads(line)
+                            chunk = data.get("response", "")
+                            if chunk:
+                                texts.append(chunk)
+                            if data.get("done"):
+                                done = True
+                                break
+                        if start:
+                            del buf[:start]
+                        # Coalesce tokens that arrived together into one frame:
+                        # same bytes on the wire, far fewer ASGI sends and encodes.
+                        # The first token still flushes immediately.
+                        while texts:
+                            batch, texts = texts[:32], texts[32:]
+                            token_count += len(batch)
+                            acc_buf += "".join(batch).encode("utf-8")
+                            if len(batch) == 1:
+                                yield _TOKEN_PREFIX + orjson.dumps(batch[0]) + _FRAME_SUFFIX
+                            else:
+                                yield _TOKENS_PREFIX + orjson.dumps(batch) + _FRAME_SUFFIX
+                        if done:
+                            break
+            interrupted = False
+        except Exception as e:  # noqa: BLE001
+            interrupted = False
+            failed = True
+            error_text = str(e)
+            add_error(error_text)
+            dbg("Model worker error: %s", e)
+            yield orjson.dumps({"type": "error", "text": error_text}) + b"\n"
         finally:
-            acc = "".join(acc_parts)
+            # Finalization runs here so a mid-stream disconnect
+            # (GeneratorExit/CancelledError at a yield above) still
+            # persists whatever was generated and closes out the job —
+            # otherwise it would stay "running" forever and leak past the
+            # overflow trim. While interrupted this block must not await:
+            # during disconnect cleanup any await is cancelled
+            # immediately, which would skip the rest of the block. That is
+            # also why the job mutations below run without _job_lock
+            # (unlike model_worker_async): acquiring it is an await, and
+            # the block is a single uninterrupted event-loop step anyway.
+            acc = acc_buf.decode("utf-8")
+            _release_buf(acc_buf)
+            answer = acc
+            thinking = ""
             if acc:
                 thinking, answer, has_thinking = split_thinking(acc)
-                result["acc"] = acc
-                result["thinking"] = thinking
-                result["answer"] = answer if has_thinking else acc
-                result["has_thinking"] = has_thinking
+                if not has_thinking:
+                    answer = acc
                 if has_thinking:
                     set_debug("model_thinking", thinking)
-                    dbg(f"Model thinking captured ({len(thinking)} chars)")
-                if not result["saved"]:
-                    state["history"].append(("assistant", acc))
-                    state["pending_requests"].pop(request_id, None)
-                    state["jobs"][request_id]["status"] = "done"
-                    state["jobs"][request_id]["raw"] = acc
-                    state["jobs"][request_id]["thinking"] = thinking
-                    state["jobs"][request_id]["answer"] = result["answer"]
-                    state["jobs"][request_id]["updated_at"] = time.time()
-                    dbg(
-                        "job id task ended "
-                        + json.dumps(
-                            {
-                                "id": request_id,
-                                "status": "done",
-                                "updated_at": state["jobs"][request_id]["updated_at"],
-                                "answer_len": len(state["jobs"][request_id]["answer"] or ""),
-                                "raw_len": len(state["jobs"][request_id]["raw"] or ""),
-                                "thinking_len": len(state["jobs"][request_id]["thinking"] or ""),
-                            }
-                        )
+                    dbg("Model thinking captured (%d chars)", len(thinking))
+                state["history"].append(("assistant", acc))
+                append_history(session_id, "assistant", acc)
+                if not failed and not interrupted and not cache_hit and not use_search and not has_thinking:
+                    # Reached only on normal completion, so this await
+                    # can't be hit by the disconnect cleanup above; the
+                    # sqlite insert + prune + fsync stay off the loop.
+                    await run_in_threadpool(
+                        reply_cache.put, prompt, model, acc, cache_ctx
                     )
-                    save_session(session_id, state)
-                    result["saved"] = True
-                    dbg("Response saved to history (worker)")
+            state["pending_requests"].pop(request_id, None)
+            job = state["jobs"][request_id]
+            if failed:
+                job["status"] = "error"
+                job["error"] = error_text
+            elif interrupted:
+                job["status"] = "cancelled"
+                job["error"] = "client disconnected"
+            elif acc:
+                job["status"] = "done"
             else:
-                state["pending_requests"].pop(request_id, None)
-                state["jobs"][request_id]["status"] = "error"
-                state["jobs"][request_id]["error"] = "empty response"
-                state["jobs"][request_id]["updated_at"] = time.time()
+                job["status"] = "error"
+                job["error"] = "empty response"
+            job["raw"] = acc
+            job["thinking"] = thinking
+            job["answer"] = answer
+            job["updated_at"] = time.time()
+            if DEBUG_ENABLED:
                 dbg(
                     "job id task ended "
-                    + json.dumps(
+                    + orjson.dumps(
                         {
                             "id": request_id,
-                            "status": "error",
-                            "updated_at": state["jobs"][request_id]["updated_at"],
-                            "error": "empty response",
+                            "status": job["status"],
+                            "updated_at": job["updated_at"],
+                            "answer_len": len(answer or ""),
+                            "raw_len": len(acc or ""),
+                            "thinking_len": len(thinking or ""),
+                            "error": job.get("error", ""),
                         }
-                    )
+                    ).decode()
                 )
-                save_session(session_id, state)
-            push_status("Finalizing output…")
-            asyncio.run_coroutine_threadsafe(queue.put({"type": "end"}), loop)
-
-    threading.Thread(target=model_worker, daemon=True).start()
-
-    async def event_stream():
-        yield json.dumps({"type": "job", "job_id": request_id}) + "\n"
-        if search_error:
-            yield json.dumps(
-                {
-                    "type": "notice",
-                    "text": f"Search unavailable: {search_error}",
-                }
-            ) + "\n"
-        if timed_out:
-            yield json.dumps(
-                {
-                    "type": "notice",
-                    "text": f"Search/fetch capped at {SEARCH_TIME_BUDGET // 60} minute(s).",
-                }
-            ) + "\n"
-
-        while True:
-            item = await queue.get()
-            if item["type"] == "token":
-                yield json.dumps(item) + "\n"
-            elif item["type"] == "error":
-                dbg(f"Model worker error: {item['text']}")
-                push_status("Model error; see logs")
-                yield json.dumps(item) + "\n"
-                break
-            elif item["type"] == "end":
-                acc = result["acc"] or "".join(acc_parts)
-                push_status("Done")
-                meta = {
-                    "type": "final",
-                    "raw": acc,
-                    "answer": result["answer"] if result["answer"] else acc,
-                    "thinking": result["thinking"],
-                }
-                yield json.dumps(meta) + "\n"
-                break
+            schedule_save(session_id, state)
+            if acc:
+                dbg("Response saved to history")
+
+        if not failed:
+            dbg("Done (%d chunks streamed)", token_count)
+            meta = {
+                "type": "final",
+                "raw": acc,
+                "answer": answer if answer else acc,
+                "thinking": thinking,
+            }
+            yield orjson.dumps(meta) + b"\n"
 
-    return StreamingResponse(event_stream(), media_type="text/plain")
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
 
 
 @router.post("/api/send_async")
@@ -530,132 +723,160 @@ async def send_async(request: Request):
         state["user_location"] = None
 
     state["history"].append(("user", prompt))
+    append_history(session_id, "user", prompt)
 
     request_id = uuid.uuid4().hex
     state.setdefault("pending_requests", {})
     state.setdefault("jobs", {})
-    state["pending_requests"][request_id] = {
-        "prompt": prompt,
-        "started_at": time.time(),
-    }
-    state["jobs"][request_id] = {
-        "id": request_id,
-        "prompt": prompt,
-        "status": "running",
-        "started_at": time.time(),
-        "updated_at": time.time(),
-        "answer": "",
-        "raw": "",
-        "thinking": "",
-        "error": "",
-    }
-    dbg(
-        "job id created "
-        + json.dumps(
-            {
-                "id": request_id,
-                "status": "running",
-                "started_at": state["jobs"][request_id]["started_at"],
-                "prompt_len": len(prompt),
-            }
+    async with _job_lock(session_id):
+        state["pending_requests"][request_id] = {
+            "prompt": prompt,
+            "started_at": time.time(),
+        }
+        state["jobs"][request_id] = {
+            "id": request_id,
+            "prompt": prompt,
+            "status": "running",
+            "started_at": time.time(),
+            "updated_at": time.time(),
+            "answer": "",
+            "raw": "",
+            "thinking": "",
+            "error": "",
+        }
+    if DEBUG_ENABLED:
+        dbg(
+            "job id created "
+            + orjson.dumps(
+                {
+                    "id": request_id,
+                    "status": "running",
+                    "started_at": state["jobs"][request_id]["started_at"],
+                    "prompt_len": len(prompt),
+                }
+            ).decode()
         )
-    )
-    save_session(session_id, state)
 
-    def model_worker_async():
+    async def model_worker_async():
         try:
-            deadline = time.monotonic() + SEARCH_TIME_BUDGET
-            search_context, web_context, timed_out, search_error = gather_context(
-                prompt, "", deadline
+            search_context, web_context, timed_out, search_error = await run_in_threadpool(
+                gather_context, prompt, "", SEARCH_TIME_BUDGET
             )
             set_debug("search_error", search_error)
             if search_error:
                 add_error(search_error)
 
-            chat_context = build_chat_context(state["history"])
+            chat_context = build_chat_context_cached(state)
             file_ctx = state.get("file_context", "")
-            loc = state.get("user_location") or {}
-            location_ctx = ""
-            if isinstance(loc, dict) and loc.get("lat") is not None and loc.get("lon") is not None:
-                parts = [f"lat={loc.get('lat')}", f"lon={loc.get('lon')}"]
-                if loc.get("accuracy") is not None:
-                    parts.append(f"accuracy_m={loc.get('accuracy')}")
-                if loc.get("timestamp"):
-                    parts.append(f"timestamp={loc.get('timestamp')}")
-                location_ctx = "USER LOCATION: " + ", ".join(parts)
-            if location_ctx:
-                file_ctx = f"{location_ctx}\n\n{file_ctx}" if file_ctx else location_ctx
+            location_ctx = _location_context(state)
+            cache_ctx = "\x00".join((file_ctx, location_ctx, chat_context))
 
             full_prompt = build_prompt(
-                file_ctx, search_context, web_context, chat_context
+                file_ctx, location_ctx, search_context, web_context, chat_context
             )
 
-            generate_url, headers, model = get_ollama_endpoint()
-            dbg(f"Async request to model={model} url={generate_url}")
-            acc_parts: List[str] = []
-            with requests.post(
-                generate_url,
-                json={"model": model, "prompt": full_prompt, "stream": True},
-                stream=True,
-                timeout=300,
-                headers=headers,
-            ) as r:
-                r.raise_for_status()
-                for line in r.iter_lines(decode_unicode=True):
-                    if not line:
-                        continue
-                    data = json.loads(line)
-                    chunk = data.get("response", "")
-                    if chunk:
-                        acc_parts.append(chunk)
-                    if data.get("done"):
-                        break
-
-            acc = "".join(acc_parts)
+            # Blocking version probe (see the streaming path): thread pool.
+            generate_url, headers, model = await run_in_threadpool(get_ollama_endpoint)
+            cached_answer = (
+                None
+                if use_search
+                else await run_in_threadpool(reply_cache.get, prompt, model, cache_ctx)
+            )
+            if cached_answer is not None:
+                dbg("Reply cache hit")
+                acc = cached_answer
+            else:
+                dbg("Async request to model=%s url=%s", model, generate_url)
+                acc_parts: List[str] = []
+                async with _HTTPX.stream(
+                    "POST",
+                    generate_url,
+                    json={"model": model, "prompt": full_prompt, "stream": True},
+                    headers=headers,
+                ) as r:
+                    r.raise_for_status()
+                    buf = bytearray()
+                    done = False
+                    # Same raw-byte NDJSON splitter as the streaming path:
+                    # one bytearray reused across reads instead of a str
+                    # allocation per line (and no chunk_size — see above).
+                    async for raw in r.aiter_raw():
+                        buf += raw
+                        start = 0
+                        while True:
+                            nl = buf.find(b"\n", start)
+                            if nl < 0:
+                                break
+                            line = bytes(buf[start:nl])
+                            start = nl + 1
+                            if not line:
+                                continue
+                            data = orjson.loads(line)
+                            chunk = data.get("response", "")
+                            if chunk:
+                                acc_parts.append(chunk)
+                            if data.get("done"):
+                                done = True
+                                break
+                        if start:
+                            del buf[:start]
+                        if done:
+                            break
+                acc = "".join(acc_parts)
+
             thinking, answer, has_thinking = split_thinking(acc)
             if has_thinking:
                 set_debug("model_thinking", thinking)
             state["history"].append(("assistant", acc))
-            state["pending_requests"].pop(request_id, None)
-            state["jobs"][request_id]["status"] = "done"
-            state["jobs"][request_id]["raw"] = acc
-            state["jobs"][request_id]["thinking"] = thinking
-            state["jobs"][request_id]["answer"] = answer if has_thinking else acc
-            state["jobs"][request_id]["updated_at"] = time.time()
-            dbg(
-                "job id task ended "
-                + json.dumps(
-                    {
-                        "id": request_id,
-                        "status": "done",
-                        "updated_at": state["jobs"][request_id]["updated_at"],
-                        "answer_len": len(state["jobs"][request_id]["answer"] or ""),
-                        "raw_len": len(state["jobs"][request_id]["raw"] or ""),
-                        "thinking_len": len(state["jobs"][request_id]["thinking"] or ""),
-                    }
+            append_history(session_id, "assistant", acc)
+            if cached_answer is None and not use_search and not has_thinking:
+                await run_in_threadpool(reply_cache.put, prompt, model, acc, cache_ctx)
+            async with _job_lock(session_id):
+                state["pending_requests"].pop(request_id, None)
+                state["jobs"][request_id]["status"] = "done"
+                state["jobs"][request_id]["raw"] = acc
+                state["jobs"][request_id]["thinking"] = thinking
+                state["jobs"][request_id]["answer"] = answer if has_thinking else acc
+                state["jobs"][request_id]["updated_at"] = time.time()
+            if DEBUG_ENABLED:
+                dbg(
+                    "job id task ended "
+                    + orjson.dumps(
+                        {
+                            "id": request_id,
+                            "status": "done",
+                            "updated_at": state["jobs"][request_id]["updated_at"],
+                            "answer_len": len(state["jobs"][request_id]["answer"] or ""),
+                            "raw_len": len(state["jobs"][request_id]["raw"] or ""),
+                            "thinking_len": len(state["jobs"][request_id]["thinking"] or ""),
+                        }
+                    ).decode()
                 )
-            )
-            save_session(session_id, state)
+            schedule_save(session_id, state)
         except Exception as e:  # noqa: BLE001
             add_error(str(e))
-            state["pending_requests"].pop(request_id, None)
-            state["jobs"][request_id]["status"] = "error"
-            state["jobs"][request_id]["error"] = str(e)
-            state["jobs"][request_id]["updated_at"] = time.time()
-            dbg(
-                "job id task ended "
-                + json.dumps(
-                    {
-                        "id": request_id,
-                        "status": "error",
-                        "updated_at": state["jobs"][request_id]["updated_at"],
-                        "error": str(e),
-                    }
+            async with _job_lock(session_id):
+                state["pending_requests"].pop(request_id, None)
+                state["jobs"][request_id]["status"] = "error"
+                state["jobs"][request_id]["error"] = str(e)
+                state["jobs"][request_id]["updated_at"] = time.time()
+            if DEBUG_ENABLED:
+                dbg(
+                    "job id task ended "
+                    + orjson.dumps(
+                        {
+                            "id": request_id,
+                            "status": "error",
+                            "updated_at": state["jobs"][request_id]["updated_at"],
+                            "error": str(e),
+                        }
+                    ).decode()
                 )
-            )
-            save_session(session_id, state)
+            schedule_save(session_id, state)
 
-    threading.Thread(target=model_worker_async, daemon=True).start()
+    task = asyncio.create_task(model_worker_async())
+    _bg_tasks.add(task)
+    task.add_done_callback(_bg_tasks.discard)
     return {"job_id": request_id}
 
 
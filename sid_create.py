@@ -1,10 +1,14 @@
-import json
+import asyncio
+import time
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 import uuid
 
+import orjson
+
 from Debug import dbg
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from Config import apply_defaults
 from Data_retension import archive_session_file, archive_session_uploads, purge_expired
@@ -24,13 +28,74 @@ def _session_path(session_id: str) -> Path:
     return SESSIONS_DIR / f"{_sanitize_session_id(session_id)}.json"
 
 
+def _history_path(session_id: str) -> Path:
+    return SESSIONS_DIR / f"{_sanitize_session_id(session_id)}.history.jsonl"
+
+
+def append_history(session_id: str, role: str, text: str) -> None:
+    """Append one turn to the session's history log.
+
+    The log is append-only JSONL, so persisting a message is O(1) no
+    matter how long the conversation has grown; the head JSON written by
+    save_session excludes the history entirely.
+    """
+    try:
+        with open(_history_path(session_id), "ab") as f:
+            f.write(orjson.dumps([role, text]) + b"\n")
+    except Exception as exc:  # noqa: BLE001
+        print(f"Failed to append history for {session_id}: {exc}")
+
+
+def _materialize_history(session_id: str, head: dict) -> None:
+    """Fill head["history"] from the JSONL log (or migrate a legacy file).
+
+    Pre-JSONL sessions embedded the full history in the session JSON;
+    those entries seed the log once, after which the log is the single
+    source of truth.
+    """
+    hist_path = _history_path(session_id)
+    legacy = head.get("history") or []
+    history: list = []
+    if hist_path.exists():
+        try:
+            with open(hist_path, "rb") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        history.append(orjson.loads(line))
+        except Exception:  # noqa: BLE001
+            history = list(legacy)
+    else:
+        if legacy:
+            try:
+                with open(hist_path, "ab") as f:
+                    for entry in legacy:
+                        f.write(orjson.dumps(entry) + b"\n")
+            except Exception as exc:  # noqa: BLE001
+                print(f"Failed to migrate history for {session_id}: {exc}")
+        history = list(legacy)
+    head["history"] = history
+
+
+# Parsed session files keyed by sid with the mtime they were read at;
+# repeat cold loads of an unchanged file skip the read + parse entirely.
+_DISK_CACHE: Dict[str, Tuple[float, dict]] = {}
+
+
 def load_session(session_id: str) -> dict:
     """Load a session from disk if present; otherwise return a fresh state."""
+    sid = _sanitize_session_id(session_id)
     path = _session_path(session_id)
     if path.exists():
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
+            mtime = path.stat().st_mtime
+            cached = _DISK_CACHE.get(sid)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            data = orjson.loads(path.read_bytes())
             if isinstance(data, dict):
+                _materialize_history(session_id, data)
+                _DISK_CACHE[sid] = (mtime, data)
                 dbg(f"Session {session_id} loaded from disk")
                 return data
         except Exception:  # noqa: BLE001
@@ -41,16 +106,54 @@ def load_session(session_id: str) -> dict:
 
 def save_session(session_id: str, state: dict) -> None:
     """Persist session state to disk (atomic write)."""
+    sid = _sanitize_session_id(session_id)
     path = _session_path(session_id)
     tmp = path.with_suffix(".tmp")
     try:
-        tmp.write_text(json.dumps(state, ensure_ascii=False, indent=2), encoding="utf-8")
+        # History lives in the append-only log; the head stays small, so
+        # this write no longer grows with conversation length. The
+        # rendered-lines cache is derived and rebuilt on demand.
+        head = {
+            k: v for k, v in state.items() if k not in ("history", "_chat_ctx_lines")
+        }
+        tmp.write_bytes(orjson.dumps(head))
         tmp.replace(path)
+        _DISK_CACHE[sid] = (path.stat().st_mtime, state)
         dbg(f"Session {session_id} saved to disk")
     except Exception as exc:  # noqa: BLE001
         print(f"Failed to save session {session_id}: {exc}")
 
 
+# Debounced persistence: hot paths used to call save_session synchronously
+# (a full-serialize disk write on the event loop) several times per
+# request. Writes within the window coalesce into one, done in the
+# threadpool.
+_SAVE_DEBOUNCE_S = 0.1
+_pending_saves: Dict[str, dict] = {}
+
+
+async def _flush_save(session_id: str) -> None:
+    await asyncio.sleep(_SAVE_DEBOUNCE_S)
+    state = _pending_saves.pop(session_id, None)
+    if state is not None:
+        await run_in_threadpool(save_session, session_id, state)
+
+
+def schedule_save(session_id: str, state: dict) -> None:
+    """Coalesce save_session calls per session; must run on the event loop."""
+    already_pending = session_id in _pending_saves
+    _pending_saves[session_id] = state
+    if not already_pending:
+        asyncio.get_running_loop().create_task(_flush_save(session_id))
+
+
+def flush_session(session_id: str) -> None:
+    """Write any pending debounced state immediately."""
+    state = _pending_saves.pop(session_id, None)
+    if state is not None:
+        save_session(session_id, state)
+
+
 def get_state(session_id: str) -> dict:
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
@@ -60,24 +163,45 @@ def get_state(session_id: str) -> dict:
     apply_defaults(state)
     state["session_id"] = session_id
     purge_expired()
-    save_session(session_id, state)
     return state
 
 
+# Directory scans behind a short TTL: the listing endpoint may be polled
+# but the set of session files changes rarely.
+_LIST_TTL_S = 1.0
+_list_cache: Tuple[float, list] = (0.0, [])
+
+
 def list_session_ids() -> list[str]:
+    global _list_cache
+    now = time.monotonic()
+    if now - _list_cache[0] < _LIST_TTL_S:
+        return _list_cache[1]
     disk_sessions = {p.stem for p in SESSIONS_DIR.glob("*.json")}
     memory_sessions = set(STATE.keys())
-    return sorted(disk_sessions | memory_sessions)
+    ids = sorted(disk_sessions | memory_sessions)
+    _list_cache = (now, ids)
+    return ids
 
 
 def delete_session(session_id: str) -> str:
     sid = _sanitize_session_id(session_id)
+    # Flush any pending write first so the archive gets the latest state
+    # and no debounced task resurrects the file after deletion.
+    flush_session(session_id)
+    flush_session(sid)
     STATE.pop(sid, None)
+    _DISK_CACHE.pop(sid, None)
     path = _session_path(sid)
     if path.exists():
         archive_session_file(path, sid)
+    hist_path = _history_path(sid)
+    if hist_path.exists():
+        archive_session_file(hist_path, sid)
     archive_session_uploads(sid)
     purge_expired()
+    global _list_cache
+    _list_cache = (0.0, [])
     return sid
 
 
@@ -88,4 +212,6 @@ def create_session(session_id: Optional[str] = None) -> str:
         STATE[sid] = {}
     apply_defaults(STATE[sid])
     save_session(sid, STATE[sid])
+    global _list_cache
+    _list_cache = (0.0, [])
     return sid
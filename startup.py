@@ -1,47 +1,108 @@
+import asyncio
 import os
 import shutil
-import threading
 import time
 from typing import Optional
 
 from Model import CLOUD_MODEL, get_ollama_endpoint
 
+_TUNNEL_LOG = "/tmp/cloudflared.log"
+_tunnel_proc: Optional[asyncio.subprocess.Process] = None
 
-def start_tunnel(port: int) -> Optional[str]:
+
+async def _drain_tunnel_output(proc: asyncio.subprocess.Process, log) -> None:
+    """Keep reading cloudflared output so its pipe never fills up."""
+    try:
+        while True:
+            line = await proc.stdout.readline()
+            if not line:
+                break
+            log.write(line)
+            log.flush()
+    except Exception:  # noqa: BLE001
+        pass
+    finally:
+        log.close()
+
+
+async def start_tunnel(port: int, timeout_s: float = 30.0) -> Optional[str]:
     """
     Start a public tunnel using Cloudflare quick tunnel.
     Env toggle:
       USE_CLOUDFLARE=1 -> use cloudflared quick tunnel if installed.
       CLOUDFLARE_HOSTNAME=<your.domain.com> -> bind to that hostname (requires cloudflared login + DNS in Cloudflare).
     Returns the public URL or None.
+
+    The process is spawned without a shell and its output is streamed
+    line-by-line, so the URL is returned as soon as cloudflared prints it
+    instead of after a fixed polling interval re-reading the whole log.
     """
+    global _tunnel_proc
     use_cf = os.environ.get("USE_CLOUDFLARE", "1") == "1"
     hostname = os.environ.get("CLOUDFLARE_HOSTNAME", "app.polardev.org")
 
-    if use_cf and shutil.which("cloudflared"):
-        log_path = "/tmp/cloudflared.log"
-        cmd = f"cloudflared tunnel --url http://localhost:{port} --no-autoupdate"
-        if hostname:
-            cmd += f" --hostname {hostname}"
-        threading.Thread(
-            target=lambda: os.system(f"{cmd} > {log_path} 2>&1"),
-            daemon=True,
-        ).start()
-        # Poll the log for the assigned URL (trycloudflare.com)
-        for _ in range(30):
-            try:
-                with open(log_path, "r", encoding="utf-8", errors="ignore") as f:
-                    for line in f.readlines():
-                        if hostname and hostname in line:
-                            return f"https://{hostname}"
-                        if "trycloudflare.com" in line:
-                            return line.strip().split()[-1]
-            except Exception:
-                pass
-            time.sleep(1)
-        print("cloudflared started but no public URL found (check /tmp/cloudflared.log)")
-
-    return None
+    if not (use_cf and shutil.which("cloudflared")):
+        return None
+
+    args = ["cloudflared", "tunnel", "--url", f"http://localhost:{port}", "--no-autoupdate"]
+    if hostname:
+        args += ["--hostname", hostname]
+    log = open(_TUNNEL_LOG, "ab")
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
+    except Exception as exc:  # noqa: BLE001
+        log.close()
+        print(f"cloudflared failed to start: {exc}")
+        return None
+    _tunnel_proc = proc
+
+    url: Optional[str] = None
+    deadline = time.monotonic() + timeout_s
+    while url is None:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            line = await asyncio.wait_for(proc.stdout.readline(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if not line:
+            break
+        log.write(line)
+        log.flush()
+        text = line.decode("utf-8", errors="ignore")
+        if hostname and hostname in text:
+            url = f"https://{hostname}"
+        elif "trycloudflare.com" in text:
+            url = text.strip().split()[-1]
+
+    if url is None:
+        print(f"cloudflared started but no public URL found (check {_TUNNEL_LOG})")
+    # Hand the rest of the output to a background drainer; the log stays
+    # available for the log reader either way.
+    asyncio.get_running_loop().create_task(_drain_tunnel_output(proc, log))
+    return url
+
+
+async def stop_tunnel() -> None:
+    """Terminate the cloudflared process started by start_tunnel, if any."""
+    global _tunnel_proc
+    proc = _tunnel_proc
+    _tunnel_proc = None
+    if proc is None or proc.returncode is not None:
+        return
+    try:
+        proc.terminate()
+        await asyncio.wait_for(proc.wait(), 5)
+    except Exception:  # noqa: BLE001
+        try:
+            proc.kill()
+        except Exception:  # noqa: BLE001
+            pass
 
 
 def print_endpoints(port: int, public_url: Optional[str]) -> None: